@@ -12,11 +12,11 @@ SETUP IN COLAB:
 5. Run all cells!
 
 This will:
-- Fetch 5,000 projects (FY2023-2025) in parallel
+- Fetch every FY2023-2025 project in parallel, page by page
 - Tag them by size, department, country
-- Save directly to YOUR Supabase database
+- Save directly to YOUR Supabase database while later pages download
 
-Time: ~10 minutes total
+Time: ~2 minutes total
 """
 
 # ============================================================================
@@ -32,6 +32,10 @@ print("✅ Installed: supabase, requests, tqdm")
 # ============================================================================
 import requests
 import json
+import itertools
+import math
+import random
+from collections import Counter
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 from supabase import create_client
@@ -56,34 +60,59 @@ print(f"✅ Connected to Supabase!")
 print(f"   URL: {SUPABASE_URL[:40]}...")
 
 # ============================================================================
-# CELL 4: Fetch Projects in Parallel
+# CELL 4: Paginated Project Fetcher
 # ============================================================================
-def fetch_projects_page(page, per_page=100):
-    try:
-        offset = (page - 1) * per_page
-        url = f"https://search.worldbank.org/api/v2/projects?format=json&appr_yr=2023,2024,2025&rows={per_page}&os={offset}"
-        response = requests.get(url, timeout=30)
-        if response.ok:
-            data = response.json()
-            if data and 'projects' in data:
-                return list(data['projects'].values())
-    except:
-        pass
-    return []
-
-print("📊 Fetching 5,000 projects in parallel...")
-all_projects = []
-pages = range(1, 51)
-
-with ThreadPoolExecutor(max_workers=10) as executor:
-    futures = {executor.submit(fetch_projects_page, page): page for page in pages}
-    for future in tqdm(as_completed(futures), total=len(pages), desc="Fetching"):
-        all_projects.extend(future.result())
-
-print(f"✅ Fetched {len(all_projects):,} projects!")
+PROJECTS_API = "https://search.worldbank.org/api/v2/projects"
+PER_PAGE = 100
+FETCH_WORKERS = 10
+MAX_RETRIES = 5
+
+http = requests.Session()  # keep-alive across all page requests
+
+def fetch_projects_page(page, per_page=PER_PAGE):
+    """Fetch one page of projects, retrying with exponential backoff"""
+    params = {'format': 'json', 'appr_yr': '2023,2024,2025', 'rows': per_page, 'os': (page - 1) * per_page}
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            response = http.get(PROJECTS_API, params=params, timeout=30)
+            response.raise_for_status()
+            return response.json()
+        except (requests.RequestException, ValueError):
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(min(30, 2 ** attempt) + random.random())
+
+def iter_project_pages():
+    """
+    Yield pages of projects as they arrive. The first page tells us the
+    total, so we request exactly the pages that exist.
+    """
+    seen_ids = set()
+
+    def new_projects(data):
+        page_projects = [p for pid, p in (data.get('projects') or {}).items() if pid not in seen_ids]
+        seen_ids.update(p['id'] for p in page_projects)
+        return page_projects
+
+    first = fetch_projects_page(1)
+    total = int(str(first.get('total', 0)).replace(',', ''))
+    pages = range(2, max(1, math.ceil(total / PER_PAGE)) + 1)
+    print(f"📊 API reports {total:,} projects ({len(pages) + 1} pages)")
+    yield new_projects(first)
+
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        futures = {executor.submit(fetch_projects_page, page): page for page in pages}
+        for future in tqdm(as_completed(futures), total=len(pages), desc="Fetching"):
+            try:
+                yield new_projects(future.result())
+            except Exception as e:
+                print(f"\n❌ Page {futures[future]} failed after retries: {str(e)[:100]}")
+
+    if len(seen_ids) < total:
+        print(f"⚠️  Expected {total:,} projects but received {len(seen_ids):,}")
 
 # ============================================================================
-# CELL 5: Tag Projects
+# CELL 5: Tagging
 # ============================================================================
 def categorize_size(amount):
     if amount == 0: return 'No financing'
@@ -93,69 +122,130 @@ def categorize_size(amount):
     elif amount < 500: return 'Very Large ($200-500M)'
     else: return 'Mega (> $500M)'
 
-print("🏷️  Tagging projects...")
-for p in tqdm(all_projects, desc="Tagging"):
-    commitment = float(str(p.get('totalcommamt', '0')).replace(',', '')) / 1_000_000
-    p['tagged_size'] = categorize_size(commitment)
-    p['tagged_commitment'] = commitment
-
-size_dist = {}
-for p in all_projects:
-    size_dist[p['tagged_size']] = size_dist.get(p['tagged_size'], 0) + 1
+def parse_amount(value):
+    """Parse an API amount like '1,250,000' into millions"""
+    return float(str(value or '0').replace(',', '')) / 1_000_000
 
-print("\\n💰 Distribution:")
-for size, count in sorted(size_dist.items(), key=lambda x: x[1], reverse=True):
-    print(f"  {size}: {count:,}")
+def tag_project(project):
+    commitment = parse_amount(project.get('totalcommamt'))
+    project['tagged_size'] = categorize_size(commitment)
+    project['tagged_commitment'] = commitment
+    return project
 
 # ============================================================================
-# CELL 6: Save to Supabase
+# CELL 6: Supabase Loader (batched bulk upserts)
 # ============================================================================
-print("\\n💾 Saving to Supabase database...")
-saved = 0
-errors = 0
-
-for project in tqdm(all_projects, desc="Saving"):
+BATCH_SIZE = 500             # rows per multi-row upsert
+MAX_CONCURRENT_BATCHES = 4   # batches in flight over the shared client
+
+def project_to_row(project):
+    """Map a tagged API project onto a worldbank_projects row"""
+    country_code = project.get('countrycode', [''])[0] if isinstance(project.get('countrycode'), list) else project.get('countrycode', '')
+
+    return {
+        'id': project.get('id'),
+        'project_name': project.get('project_name'),
+        'url': project.get('url'),
+        'country_code': country_code,
+        'country_name': project.get('countryshortname'),
+        'region_name': project.get('regionname'),
+        'total_commitment': project['tagged_commitment'],
+        'ibrd_commitment': parse_amount(project.get('ibrdcommamt')),
+        'ida_commitment': parse_amount(project.get('idacommamt')),
+        'total_amount_formatted': f"${project['tagged_commitment']:.0f}M",
+        'status': project.get('status') or project.get('projectstatusdisplay') or 'Active',
+        'lending_instrument': project.get('lendinginstr'),
+        'product_line': project.get('prodlinetext'),
+        'team_lead': project.get('teamleadname'),
+        'board_approval_date': project.get('boardapprovaldate'),
+        'approval_fy': int(project.get('approvalfy', 2024)),
+        'approval_month': project.get('board_approval_month'),
+        'closing_date': project.get('closingdate'),
+        'tagged_size_category': project['tagged_size'],
+        'data_verified': True
+    }
+
+def upsert_rows(rows):
+    """
+    Upsert rows in one request. If the batch is rejected, split it in half
+    and retry each side so only the offending rows are reported as failed.
+    Returns (saved_count, [(project_id, error), ...]).
+    """
     try:
-        country_code = project.get('countrycode', [''])[0] if isinstance(project.get('countrycode'), list) else project.get('countrycode', '')
-        
-        data = {
-            'id': project.get('id'),
-            'project_name': project.get('project_name'),
-            'url': project.get('url'),
-            'country_code': country_code,
-            'country_name': project.get('countryshortname'),
-            'region_name': project.get('regionname'),
-            'total_commitment': project['tagged_commitment'],
-            'ibrd_commitment': float(str(project.get('ibrdcommamt', '0')).replace(',', '')) / 1_000_000,
-            'ida_commitment': float(str(project.get('idacommamt', '0')).replace(',', '')) / 1_000_000,
-            'total_amount_formatted': f"${project['tagged_commitment']:.0f}M",
-            'status': project.get('status') or project.get('projectstatusdisplay') or 'Active',
-            'lending_instrument': project.get('lendinginstr'),
-            'product_line': project.get('prodlinetext'),
-            'team_lead': project.get('teamleadname'),
-            'board_approval_date': project.get('boardapprovaldate'),
-            'approval_fy': int(project.get('approvalfy', 2024)),
-            'approval_month': project.get('board_approval_month'),
-            'closing_date': project.get('closingdate'),
-            'tagged_size_category': project['tagged_size'],
-            'data_verified': True
-        }
-        
-        supabase.table('worldbank_projects').upsert(data).execute()
-        saved += 1
-        
+        supabase.table('worldbank_projects').upsert(rows).execute()
+        return len(rows), []
     except Exception as e:
-        errors += 1
-        if errors <= 3:
-            print(f"\\nError: {str(e)[:100]}")
+        if len(rows) == 1:
+            return 0, [(rows[0].get('id'), str(e)[:100])]
+        mid = len(rows) // 2
+        saved_left, failed_left = upsert_rows(rows[:mid])
+        saved_right, failed_right = upsert_rows(rows[mid:])
+        return saved_left + saved_right, failed_left + failed_right
 
-print(f"\\n{'='*70}")
-print(f"✅ Successfully saved: {saved:,} projects")
+# ============================================================================
+# CELL 7: Stream fetch → tag → save
+# ============================================================================
+# Each page is tagged, counted and queued for the database as soon as it
+# arrives, so writes run while later pages are still downloading.
+print("🚀 Fetching, tagging and saving projects...")
+start_time = time.time()
+fetched = 0
+saved = 0
+failed = []
+size_dist = Counter()
+total_commitment = 0.0
+pending_rows = []
+
+batch_numbers = itertools.count(1)
+
+def collect_batch(future, batch_no):
+    """Record a finished batch and return how many rows it saved"""
+    batch_saved, batch_failed = future.result()
+    failed.extend(batch_failed)
+    if batch_failed:
+        print(f"\n⚠️  Batch {batch_no}: {batch_saved} saved, {len(batch_failed)} failed")
+    return batch_saved
+
+with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_BATCHES) as writer:
+    in_flight = {}
+
+    for page in iter_project_pages():
+        for project in page:
+            tag_project(project)
+            fetched += 1
+            size_dist[project['tagged_size']] += 1
+            total_commitment += project['tagged_commitment']
+            try:
+                pending_rows.append(project_to_row(project))
+            except Exception as e:
+                failed.append((project.get('id'), f"Bad row: {str(e)[:100]}"))
+
+        while len(pending_rows) >= BATCH_SIZE:
+            in_flight[writer.submit(upsert_rows, pending_rows[:BATCH_SIZE])] = next(batch_numbers)
+            pending_rows = pending_rows[BATCH_SIZE:]
+
+        # Collect finished batches so memory stays bounded to what is in flight
+        for future in [f for f in in_flight if f.done()]:
+            saved += collect_batch(future, in_flight.pop(future))
+
+    if pending_rows:
+        in_flight[writer.submit(upsert_rows, pending_rows)] = next(batch_numbers)
+    for future in as_completed(list(in_flight)):
+        saved += collect_batch(future, in_flight.pop(future))
+
+print(f"\n✅ Fetched {fetched:,} projects!")
+print("\n💰 Distribution:")
+for size, count in size_dist.most_common():
+    print(f"  {size}: {count:,}")
+
+errors = len(failed)
+print(f"\n{'='*70}")
+print(f"✅ Successfully saved: {saved:,} projects in {time.time() - start_time:.1f}s")
 print(f"❌ Errors: {errors}")
-print(f"Success rate: {(saved/len(all_projects))*100:.1f}%")
+for project_id, error in failed[:5]:
+    print(f"   {project_id}: {error}")
+print(f"Success rate: {(saved/max(1, fetched))*100:.1f}%")
 print(f"{'='*70}")
 
-total_commitment = sum(p['tagged_commitment'] for p in all_projects)
-print(f"\\n💵 Total in database: ${total_commitment/1000:.1f}B")
+print(f"\n💵 Total in database: ${total_commitment/1000:.1f}B")
 print(f"🎉 ALL DONE! Check your Supabase database now!")
-
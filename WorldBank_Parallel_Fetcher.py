@@ -12,29 +12,193 @@ Fetches:
 Output: SQL-ready data or JSON files
 """
 
-import requests
+import argparse
+import asyncio
+import hashlib
 import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import time
+import os
+import math
+import random
+import textwrap
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import aiohttp
 
 # ============================================================================
 # 1. FETCH PROJECTS IN PARALLEL
 # ============================================================================
 
-def fetch_projects_page(page, per_page=100):
-    """Fetch one page of projects"""
+PROJECTS_API = "https://search.worldbank.org/api/v2/projects"
+PROJECTS_QUERY = {'format': 'json', 'appr_yr': '2023,2024,2025'}
+PER_PAGE = 100
+MAX_CONCURRENCY = 10
+MAX_RETRIES = 5
+
+async def fetch_projects_page(session, page, per_page=PER_PAGE, retries=MAX_RETRIES, extra_params=None):
+    """Fetch one page of projects, retrying with exponential backoff"""
+    params = {**PROJECTS_QUERY, **(extra_params or {}), 'rows': per_page, 'os': (page - 1) * per_page}
+
+    for attempt in range(1, retries + 1):
+        try:
+            async with session.get(PROJECTS_API, params=params) as response:
+                response.raise_for_status()
+                return await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            if attempt == retries:
+                raise
+            delay = min(30, 2 ** attempt) + random.random()
+            print(f"  ⚠️  Page {page} failed ({e}), retry {attempt}/{retries - 1} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def iter_project_pages(per_page=PER_PAGE, max_concurrency=MAX_CONCURRENCY):
+    """
+    Yield pages of projects matching PROJECTS_QUERY as they arrive.
+    Reads the total from the first page, then fans out exactly the remaining
+    pages over one pooled session with bounded concurrency. Projects already
+    seen on an earlier page are dropped so each id is yielded once.
+    """
+    connector = aiohttp.TCPConnector(limit=max_concurrency, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=30)
+    seen_ids = set()
+    failed_pages = []
+
+    def new_projects(data):
+        page_projects = []
+        for project_id, project in (data.get('projects') or {}).items():
+            if project_id not in seen_ids:
+                seen_ids.add(project_id)
+                page_projects.append(project)
+        return page_projects
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        first = await fetch_projects_page(session, 1, per_page)
+        total = int(str(first.get('total', 0)).replace(',', ''))
+        total_pages = max(1, math.ceil(total / per_page))
+        print(f"  API reports {total:,} projects across {total_pages} pages")
+        yield new_projects(first)
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def fetch_bounded(page):
+            async with semaphore:
+                try:
+                    return page, await fetch_projects_page(session, page, per_page)
+                except Exception as e:
+                    return page, e
+
+        tasks = [asyncio.create_task(fetch_bounded(page)) for page in range(2, total_pages + 1)]
+        completed = 1
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                page, data = await next_done
+                completed += 1
+                if isinstance(data, Exception):
+                    failed_pages.append(page)
+                    print(f"  ❌ Page {page} failed after retries: {data}")
+                else:
+                    yield new_projects(data)
+                if completed % 10 == 0 or completed == total_pages:
+                    print(f"  Progress: {completed}/{total_pages} pages ({len(seen_ids):,} projects)")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    if failed_pages:
+        print(f"\n⚠️  {len(failed_pages)} pages could not be fetched: {sorted(failed_pages)}")
+    if len(seen_ids) < total:
+        print(f"⚠️  Expected {total:,} projects but received {len(seen_ids):,}")
+
+async def iter_recent_project_pages(since, per_page=PER_PAGE):
+    """
+    Yield pages newest-approval-first until a page is entirely older than
+    `since`. Used by incremental sync, where only a handful of pages change.
+    """
+    order = {'srt': 'boardapprovaldate', 'order': 'desc'}
+    timeout = aiohttp.ClientTimeout(total=30)
+
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        page = 1
+        while True:
+            data = await fetch_projects_page(session, page, per_page, extra_params=order)
+            projects = list((data.get('projects') or {}).values())
+            yield projects
+
+            total = int(str(data.get('total', 0)).replace(',', ''))
+            dates = [p['boardapprovaldate'] for p in projects if p.get('boardapprovaldate')]
+            if not projects or page * per_page >= total or (dates and max(dates) < since):
+                print(f"  Checked {page} pages back to {since[:10]}")
+                return
+            page += 1
+
+# ============================================================================
+# INCREMENTAL SYNC STATE
+# ============================================================================
+
+SYNC_STATE_PATH = 'worldbank_projects_sync_state.json'
+LOOKBACK_DAYS = 30  # re-check recently approved projects for late edits
+
+class SyncState:
+    """High-water mark and per-project content hashes kept between runs"""
+
+    def __init__(self, path=SYNC_STATE_PATH):
+        self.path = path
+        self.high_water_mark = None
+        self.hashes = {}
+        self.unchanged = 0
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.high_water_mark = state.get('high_water_mark')
+            self.hashes = state.get('hashes', {})
+
+    @staticmethod
+    def content_hash(project):
+        """Stable hash of the raw API record (before tagging)"""
+        payload = json.dumps(project, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+    def since(self, lookback_days=LOOKBACK_DAYS):
+        """Approval date to walk back to, or None when there is no prior run"""
+        if not self.high_water_mark:
+            return None
+        mark = datetime.fromisoformat(self.high_water_mark.replace('Z', '+00:00'))
+        return (mark - timedelta(days=lookback_days)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    def changed(self, projects):
+        """Return only new or modified projects, recording their hashes"""
+        changed = []
+        for project in projects:
+            digest = self.content_hash(project)
+            if self.hashes.get(project.get('id')) == digest:
+                self.unchanged += 1
+                continue
+            self.hashes[project.get('id')] = digest
+            changed.append(project)
+            approved = project.get('boardapprovaldate')
+            if approved and (not self.high_water_mark or approved > self.high_water_mark):
+                self.high_water_mark = approved
+        return changed
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'high_water_mark': self.high_water_mark,
+                'updated_at': datetime.now(timezone.utc).isoformat(),
+                'hashes': self.hashes,
+            }, f)
+        os.replace(tmp_path, self.path)
+
+def run_async(coro):
+    """Run a coroutine from sync code, even inside Colab/Jupyter's running loop"""
     try:
-        offset = (page - 1) * per_page
-        url = f"https://search.worldbank.org/api/v2/projects?format=json&appr_yr=2023,2024,2025&rows={per_page}&os={offset}"
-        response = requests.get(url, timeout=30)
-        
-        if response.ok:
-            data = response.json()
-            if data and 'projects' in data:
-                return list(data['projects'].values())
-    except:
-        pass
-    return []
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
 
 def categorize_size(amount):
     """Categorize project by financial size"""
@@ -45,76 +209,75 @@ def categorize_size(amount):
     elif amount < 500: return 'Very Large ($200-500M)'
     else: return 'Mega (> $500M)'
 
-print("🚀 Starting parallel fetch...")
-print("="*70)
-
-# Fetch all projects in parallel (FAST!)
-print("\n📊 Fetching projects in parallel with 10 workers...")
-all_projects = []
-pages = range(1, 51)  # Up to 5000 projects
-
-with ThreadPoolExecutor(max_workers=10) as executor:
-    futures = {executor.submit(fetch_projects_page, page): page for page in pages}
-    
-    completed = 0
-    for future in as_completed(futures):
-        projects = future.result()
-        all_projects.extend(projects)
-        completed += 1
-        if completed % 10 == 0:
-            print(f"  Progress: {completed}/50 pages ({len(all_projects)} projects)")
-
-print(f"\n✅ Fetched {len(all_projects):,} projects in parallel!")
-
-# Tag projects
-print("\n🏷️  Tagging projects...")
-for p in all_projects:
-    commitment = float(str(p.get('totalcommamt', '0')).replace(',', '')) / 1_000_000
-    p['tagged_size'] = categorize_size(commitment)
-    p['tagged_commitment'] = commitment
-    p['tagged_country'] = p.get('countryshortname', '')
-    p['tagged_region'] = p.get('regionname', '')
-
-# Statistics
-size_dist = {}
-for p in all_projects:
-    size = p['tagged_size']
-    size_dist[size] = size_dist.get(size, 0) + 1
-
-print("\n💰 Projects by Size:")
-for size, count in sorted(size_dist.items(), key=lambda x: x[1], reverse=True):
-    print(f"  {size}: {count:,}")
-
-total_commitment = sum(p['tagged_commitment'] for p in all_projects)
-print(f"\n💵 Total Commitment: ${total_commitment/1000:.1f}B")
+def tag_project(project):
+    """Add tagged_* fields to an API project in place"""
+    commitment = float(str(project.get('totalcommamt', '0')).replace(',', '')) / 1_000_000
+    project['tagged_size'] = categorize_size(commitment)
+    project['tagged_commitment'] = commitment
+    project['tagged_country'] = project.get('countryshortname', '')
+    project['tagged_region'] = project.get('regionname', '')
+    return project
 
 # ============================================================================
-# 2. SAVE TO JSON
+# 2. STREAMING SINKS
 # ============================================================================
 
-print("\n💾 Saving to JSON files...")
+class ProjectStats:
+    """Running totals, updated one page at a time"""
 
-# Save projects
-with open('worldbank_projects_tagged.json', 'w') as f:
-    json.dump(all_projects, f, indent=2)
+    def __init__(self):
+        self.count = 0
+        self.total_commitment = 0.0
+        self.size_dist = Counter()
 
-print(f"✅ Saved {len(all_projects):,} projects to worldbank_projects_tagged.json")
+    def write(self, projects):
+        for p in projects:
+            self.count += 1
+            self.total_commitment += p['tagged_commitment']
+            self.size_dist[p['tagged_size']] += 1
 
-# ============================================================================
-# 3. GENERATE SQL SAMPLE
-# ============================================================================
+    def close(self):
+        pass
 
-print("\n📝 Generating SQL sample (first 10 projects)...")
+class JsonArraySink:
+    """Streams projects into a JSON array file without holding them all"""
 
-with open('sample_projects_insert.sql', 'w') as f:
-    f.write("-- Sample Projects INSERT Statements\\n")
-    f.write("-- Run in Supabase SQL Editor\\n\\n")
-    
-    for project in all_projects[:10]:
-        try:
-            country_code = project.get('countrycode', [''])[0] if isinstance(project.get('countrycode'), list) else project.get('countrycode', '')
-            
-            f.write(f"""INSERT INTO worldbank_projects (
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'w')
+        self.file.write('[')
+        self.count = 0
+
+    def write(self, projects):
+        for p in projects:
+            self.file.write(',\n' if self.count else '\n')
+            self.file.write(textwrap.indent(json.dumps(p, indent=2), '  '))
+            self.count += 1
+
+    def close(self):
+        self.file.write('\n]' if self.count else ']')
+        self.file.close()
+
+class SqlSampleSink:
+    """Writes INSERT statements for the first `limit` projects seen"""
+
+    def __init__(self, path, limit=10):
+        self.path = path
+        self.limit = limit
+        self.count = 0
+        self.file = open(path, 'w')
+        self.file.write("-- Sample Projects INSERT Statements\\n")
+        self.file.write("-- Run in Supabase SQL Editor\\n\\n")
+
+    def write(self, projects):
+        for project in projects:
+            if self.count >= self.limit:
+                return
+            self.count += 1
+            try:
+                country_code = project.get('countrycode', [''])[0] if isinstance(project.get('countrycode'), list) else project.get('countrycode', '')
+                
+                self.file.write(f"""INSERT INTO worldbank_projects (
   id, project_name, url, country_code, country_name, 
   status, total_commitment, approval_fy, 
   tagged_size_category, board_approval_date
@@ -132,25 +295,88 @@ with open('sample_projects_insert.sql', 'w') as f:
 ) ON CONFLICT (id) DO NOTHING;
 
 """)
-        except:
-            pass
+            except:
+                pass
 
-print("✅ Generated sample_projects_insert.sql")
+    def close(self):
+        self.file.close()
 
-# ============================================================================
-# FINAL SUMMARY
-# ============================================================================
+async def run_pipeline(sinks, state=None, since=None):
+    """Fetch → (diff) → tag → sink, one page at a time"""
+    pages = iter_recent_project_pages(since) if since else iter_project_pages()
+    async for page in pages:
+        if state is not None:
+            changed = state.changed(page)
+            if since:
+                page = changed
+        for project in page:
+            tag_project(project)
+        for sink in sinks:
+            sink.write(page)
+    for sink in sinks:
+        sink.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Fetch and tag World Bank projects (FY2023-2025)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only fetch and write projects that are new or changed since the last run')
+    parser.add_argument('--state', default=SYNC_STATE_PATH, help='sync state file (default: %(default)s)')
+    args = parser.parse_args()
+
+    print("🚀 Starting parallel fetch...")
+    print("="*70)
+
+    # Hashes are always recorded so a full run seeds the next incremental one
+    state = SyncState(args.state)
+    since = state.since() if args.incremental else None
+    if args.incremental and not since:
+        print("\nℹ️  No previous sync state found - running a full fetch")
+    suffix = '_delta' if since else ''
+    json_path = f'worldbank_projects_tagged{suffix}.json'
+    sql_path = f'sample_projects_insert{suffix}.sql'
+
+    # Each page is tagged and written as soon as it arrives (FAST!)
+    if since:
+        print(f"\n📊 Incremental sync: checking projects approved since {since[:10]}...")
+    else:
+        print(f"\n📊 Fetching projects with up to {MAX_CONCURRENCY} concurrent requests...")
+    print(f"   Tagging, saving to {json_path} and {sql_path} as pages arrive")
+    stats = ProjectStats()
+    sinks = [
+        stats,
+        JsonArraySink(json_path),
+        SqlSampleSink(sql_path),
+    ]
+    run_async(run_pipeline(sinks, state=state, since=since))
+    state.save()
+
+    print(f"\n✅ Fetched and tagged {stats.count:,} projects in parallel!")
+    if since:
+        print(f"   Unchanged since last sync (skipped): {state.unchanged:,}")
+
+    print("\n💰 Projects by Size:")
+    for size, count in stats.size_dist.most_common():
+        print(f"  {size}: {count:,}")
+
+    print(f"\n💵 Total Commitment: ${stats.total_commitment/1000:.1f}B")
+
+    # ============================================================================
+    # FINAL SUMMARY
+    # ============================================================================
 
-print("\n" + "="*70)
-print("🎉 PARALLEL FETCH COMPLETE!")
-print("="*70)
-print(f"\nProjects fetched: {len(all_projects):,}")
-print(f"Total commitment: ${total_commitment/1000:.1f}B")
-print(f"Time period: FY2023-2025")
-print("\nFiles generated:")
-print("  1. worldbank_projects_tagged.json - Full data")
-print("  2. sample_projects_insert.sql - Sample SQL")
-print("\n📥 Download these files")
-print("📋 Use them with your database loader script")
-print("="*70)
+    print("\n" + "="*70)
+    print("🎉 PARALLEL FETCH COMPLETE!")
+    print("="*70)
+    print(f"\nProjects fetched: {stats.count:,}")
+    print(f"Total commitment: ${stats.total_commitment/1000:.1f}B")
+    print(f"Time period: FY2023-2025")
+    print("\nFiles generated:")
+    print(f"  1. {json_path} - {'New/changed projects' if since else 'Full data'}")
+    print(f"  2. {sql_path} - Sample SQL")
+    print(f"  3. {args.state} - Sync state for --incremental runs")
+    print("\n📥 Download these files")
+    print("📋 Use them with your database loader script")
+    print("="*70)
 
+if __name__ == '__main__':
+    main()